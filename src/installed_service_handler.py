@@ -1,25 +1,26 @@
 import logging
 import os
-import pathlib
-from threading import Timer
-from typing import List, Optional
+import time
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Optional, Set
 
-from python_on_whales import DockerClient, docker
-from watchdog.events import FileSystemEvent, FileSystemEventHandler
-from watchdog.observers import Observer
-from watchdog.observers.api import BaseObserver
+from docker import DockerClient as DockerApiClient
+from python_on_whales import DockerClient
+from watchdog.events import FileSystemEvent, PatternMatchingEventHandler
+from watchdog.observers.api import BaseObserver, ObservedWatch
 
 logger = logging.getLogger(__name__)
 
 
-class InstalledServiceHandler(FileSystemEventHandler):
+class InstalledServiceHandler(PatternMatchingEventHandler):
     """Handler of a service on the "iombian-services" folder.
 
     When a change occurs on the service the compose restarts.
     """
 
-    ACCEPTED_FILES = ["docker-compose.yaml", "docker-compose.yml", ".env"]
-    ACCEPTED_EVENTS = ["modified", "created", "deleted"]
+    ACCEPTED_FILES = frozenset({"docker-compose.yaml", "docker-compose.yml", ".env"})
+    COMPOSE_FILES = ["docker-compose.yaml", "docker-compose.yml"]
+    ACCEPTED_EVENTS = frozenset({"modified", "created", "deleted"})
 
     service_path: str
     """The full path of the service"""
@@ -27,129 +28,244 @@ class InstalledServiceHandler(FileSystemEventHandler):
     """The name of the service"""
     wait_seconds: float
     """Seconds to wait between changes before restarting the service compose"""
-    timer: Optional[Timer]
-    """The timer used for waiting the `wait_seconds` time"""
+    reload_deadline: float
+    """The monotonic time after which the service compose is restarted"""
+    reload_event: Event
+    """The event set when a change occurs on the service"""
+    stop_event: Event
+    """The event set when the handler is stopped"""
+    changed_files: Set[str]
+    """The names of the files changed since the last restart of the service compose"""
+    up_pending: bool
+    """Whether the reload thread has to start the service compose"""
+    changed_files_lock: Lock
+    """The lock used to access the `changed_files` and `up_pending` from the other threads and the reload thread"""
+    reload_thread: Thread
+    """The thread that waits the `wait_seconds` time and restarts the service compose"""
     observer: BaseObserver
-    """The `Observer` of the service folder"""
-    files: List[str]
-    """The list of the files in the service folder"""
+    """The `Observer` shared by all the services"""
+    watch: Optional[ObservedWatch]
+    """The watch of the service folder scheduled in the `observer`"""
     docker: Optional[DockerClient]
     """The docker client of the service compose"""
+    compose_filters: Dict[str, str]
+    """The docker filters that match the containers started by the service compose"""
+    compose_env: Dict[str, str]
+    """The "COMPOSE_" variables of the ".env" file the last time the service compose was started"""
+    get_docker_api: Callable[[], DockerApiClient]
+    """The function that returns the docker engine API client shared by all the services"""
 
-    def __init__(self, service_path: str, wait_seconds: float):
+    def __init__(
+        self,
+        service_path: str,
+        wait_seconds: float,
+        get_docker_api: Callable[[], DockerApiClient],
+        observer: BaseObserver,
+    ):
+        super().__init__(
+            patterns=self.ACCEPTED_FILES, ignore_directories=True, case_sensitive=True
+        )
         self.service_path = service_path
-        self.service_name = service_path.split("/")[-1]
+        self.service_name = os.path.basename(service_path.rstrip("/"))
         self.wait_seconds = wait_seconds
-        self.timer = None
-        self.observer = Observer()
-        self.files = os.listdir(service_path)
+        self.get_docker_api = get_docker_api
+        self.reload_deadline = 0.0
+        self.reload_event = Event()
+        self.stop_event = Event()
+        self.changed_files = set()
+        self.up_pending = False
+        self.changed_files_lock = Lock()
+        self.reload_thread = Thread(target=self._reload_loop, daemon=True)
+        self.observer = observer
+        self.watch = None
         self.docker = self._get_docker()
+        self.compose_env = self._read_compose_env()
 
-    def start(self):
-        """Start the handler by starting the observer of the service folder."""
+    def start(self, up: bool = False):
+        """Start the handler by scheduling the watch of the service folder in the observer.
+
+        If `up` is `True`, the compose of the service is started by the reload thread, so the caller is not blocked.
+        If the folder no longer exists nothing is started, the removal of the folder takes care of the compose.
+        """
         try:
-            self.observer.schedule(self, self.service_path, recursive=True)
-            self.observer.start()
-            logger.debug(f"{self.service_name} Installed Service Handler started.")
+            self.watch = self.observer.schedule(
+                self, self.service_path, recursive=False
+            )
         except FileNotFoundError:
             logger.error(
-                f"Couldn't start a watcher for the {self.service_name} service, the folder no longer exists."
+                "Couldn't start a watcher for the %s service, the folder no longer exists.",
+                self.service_name,
             )
-            self.down()
+            return
+
+        if up:
+            with self.changed_files_lock:
+                self.up_pending = True
+            self.reload_event.set()
+        self.reload_thread.start()
+        logger.debug("%s Installed Service Handler started.", self.service_name)
 
     def stop(self):
-        """Stop the handler by stopping the observer of the service folder."""
+        """Stop the handler by unscheduling the watch of the service folder from the observer."""
         logger.debug("Installed Service Handler stopped.")
-        self.observer.stop()
+        if self.watch:
+            self.observer.unschedule(self.watch)
+            self.watch = None
+        self.stop_event.set()
+        self.reload_event.set()
 
     def up(self):
         """Start the compose of the service by doing "docker compose up"."""
         if self.docker:
             try:
                 self.docker.compose.up(detach=True)
-                logger.info(f"{self.service_name} service compose started.")
+                logger.info("%s service compose started.", self.service_name)
             except:
                 logger.error(
-                    f"An error occurred, couldn't start service {self.service_name}."
+                    "An error occurred, couldn't start service %s.", self.service_name
                 )
 
     def down(self):
         """Stop the compose of the service.
 
         This is done by getting the containers started by the compose file and killing them.
-        The volumes are pruned to remove any unused ones.
+        The stopped containers are removed all at once and the volumes are pruned to remove any unused ones.
 
         This is done like this because, when the service folder is removed the compose needs to stop.
         But, in that case, the compose file no longer exists, so "docker compose down" can't be called.
+        The requests are sent directly to the docker engine API, so no docker CLI process is spawned.
         """
         if self.docker:
-            logger.info(f"{self.service_name} service compose stopped.")
-            containers = self.docker.ps(
-                filters={
-                    "label": f"com.docker.compose.project.config_files={self.service_path}/{self.compose_file}"
-                }
-            )
+            logger.info("%s service compose stopped.", self.service_name)
+            docker_api = self.get_docker_api()
+            containers = docker_api.containers.list(filters=self.compose_filters)
             for container in containers:
-                docker.container.stop(container)
-                docker.container.remove(container)
+                container.stop()
+            docker_api.containers.prune(filters=self.compose_filters)
+
+            docker_api.volumes.prune()
 
-            docker.volume.prune()
+    def reload_service_compose(self, changed_files: Optional[Set[str]] = None):
+        """Stop the compose, get the docker client again if needed and start the compose.
 
-    def reload_service_compose(self):
-        """Stop the compose, get the docker client again and start the compose.
+        The docker client is created again if the compose file name changed, as the docker client will not be valid.
+        Otherwise, the current docker client is kept.
 
-        The docker client is loaded again because, if the compose file is changed, the docker client will not be valid.
+        If `changed_files` is given and no compose file is in it, only the ".env" file changed.
+        In that case the compose is not stopped, "docker compose up" recreates just the containers whose configuration changed.
+        This is not done if a "COMPOSE_" variable changed, as those can change the project name or the compose files,
+        and "docker compose up" would leave the old containers running.
+
+        If the service had no compose file and now it has one, the docker client is created and the compose is started.
         """
-        if not (self.docker and self.compose_file):
+        compose_file = self._get_compose_file_name()
+        if not self.docker:
+            if compose_file:
+                logger.debug("%s service compose file added.", self.service_name)
+                self.docker = self._get_docker()
+                self.compose_env = self._read_compose_env()
+                self.up()
             return
 
-        logger.debug(f"{self.service_name} service modified.")
+        logger.debug("%s service modified.", self.service_name)
+
+        compose_env = self._read_compose_env()
+        if (
+            changed_files is not None
+            and changed_files.isdisjoint(self.COMPOSE_FILES)
+            and compose_env == self.compose_env
+        ):
+            self.up()
+            return
 
         self.down()
-        self.docker = self._get_docker()
+        if compose_file != self.compose_file:
+            self.docker = self._get_docker()
+        self.compose_env = compose_env
         self.up()
 
-        self.timer = None
-
     def on_any_event(self, event: FileSystemEvent):
         """Reload the service when the service changes.
 
         The service changes when the docker-compose file or the .env file changes in the first level of the folder.
+        Only the first level of the folder is watched and only the events of the `ACCEPTED_FILES` reach this method.
+        """
+        if event.event_type in self.ACCEPTED_EVENTS:
+            with self.changed_files_lock:
+                self.changed_files.add(os.path.basename(event.src_path))
+            self.reload_deadline = time.monotonic() + self.wait_seconds
+            self.reload_event.set()
 
+    def _reload_loop(self):
+        """Restart the service compose once no change has occurred for `wait_seconds`.
+
+        Every change only moves `reload_deadline` forward, so a single thread handles all the changes of the service.
+        The thread also does the first start of the compose when it is requested in `start`.
+        A failed reload is logged and the thread keeps waiting for the next change.
         """
-        if event.is_directory:
-            return
+        while True:
+            self.reload_event.wait()
+            self.reload_event.clear()
 
-        path = pathlib.Path(event.src_path)
-        file = path.name
-        folder = path.parts[-2]
+            remaining = self.reload_deadline - time.monotonic()
+            while remaining > 0:
+                if self.stop_event.wait(remaining):
+                    return
+                remaining = self.reload_deadline - time.monotonic()
 
-        if (
-            file in self.ACCEPTED_FILES
-            and folder == self.service_name
-            and event.event_type in self.ACCEPTED_EVENTS
-        ):
-            if self.timer:
-                self.timer.cancel()
-                self.timer = None
+            if self.stop_event.is_set():
+                return
 
-            self.timer = Timer(self.wait_seconds, self.reload_service_compose)
-            self.timer.start()
+            with self.changed_files_lock:
+                changed_files = self.changed_files
+                self.changed_files = set()
+                up_pending = self.up_pending
+                self.up_pending = False
+            try:
+                if up_pending:
+                    self.up()
+                elif changed_files:
+                    self.reload_service_compose(changed_files)
+            except Exception:
+                logger.exception(
+                    "An error occurred, couldn't reload service %s.", self.service_name
+                )
 
     def _get_compose_file_name(self):
         """Get the name of the compose file in the service.
 
         This can be "docker-compose.yaml" of "docker-compose.yml".
         """
-        if "docker-compose.yaml" in self.files:
-            return "docker-compose.yaml"
-        elif "docker-compose.yml" in self.files:
-            return "docker-compose.yml"
+        for compose_file in self.COMPOSE_FILES:
+            if os.path.exists(f"{self.service_path}/{compose_file}"):
+                return compose_file
+
+    def _read_compose_env(self):
+        """Get the variables of the ".env" file of the service that start with "COMPOSE_"."""
+        compose_env = {}
+        try:
+            with open(f"{self.service_path}/.env") as env_file:
+                for line in env_file:
+                    line = line.strip()
+                    if line.startswith("export "):
+                        line = line[len("export ") :].lstrip()
+                    name, separator, value = line.partition("=")
+                    name = name.strip()
+                    if separator and name.startswith("COMPOSE_"):
+                        compose_env[name] = value.strip().strip("\"'")
+        except OSError:
+            pass
+        return compose_env
 
     def _get_docker(self):
-        """Get the docker client of the compose of the service."""
+        """Get the docker client of the compose of the service.
+
+        The `compose_filters` are also updated, using the absolute path that docker compose stores in the containers label.
+        """
         self.compose_file = self._get_compose_file_name()
         if self.compose_file:
-            return DockerClient(
-                compose_files=[f"{self.service_path}/{self.compose_file}"]
-            )
+            compose_file_path = f"{self.service_path}/{self.compose_file}"
+            self.compose_filters = {
+                "label": f"com.docker.compose.project.config_files={os.path.abspath(compose_file_path)}"
+            }
+            return DockerClient(compose_files=[compose_file_path])
@@ -1,8 +1,9 @@
 import logging
 import os
-import pathlib
-from typing import List
+from threading import Lock, Thread
+from typing import Dict, Optional
 
+from docker import DockerClient as DockerApiClient
 from watchdog.events import (
     DirCreatedEvent,
     DirDeletedEvent,
@@ -28,15 +29,21 @@ class IombianServicesHandler(FileSystemEventHandler):
     wait_seconds: float
     """Seconds waited between changes on the service before restarting the service"""
     observer: BaseObserver
-    """The `Observer` of the "iombian-services" folder"""
-    services: List[InstalledServiceHandler]
-    """List of the `InstalledServiceHandler` on the "iombian-services" folder"""
+    """The `Observer` of the "iombian-services" folder, shared with all the services"""
+    services: Dict[str, InstalledServiceHandler]
+    """The `InstalledServiceHandler` on the "iombian-services" folder, indexed by service name"""
+    docker_api: Optional[DockerApiClient]
+    """The docker engine API client shared by all the services, created on first use"""
+    docker_api_lock: Lock
+    """The lock used to create the `docker_api` only once"""
 
     def __init__(self, base_path: str, wait_seconds: float) -> None:
         self.base_path = base_path
         self.wait_seconds = wait_seconds
         self.observer = Observer()
-        self.services = []
+        self.services = {}
+        self.docker_api = None
+        self.docker_api_lock = Lock()
 
     def start(self):
         """Start the handler by starting the observer of the "iombian-services" folder."""
@@ -50,56 +57,97 @@ class IombianServicesHandler(FileSystemEventHandler):
         Also stop all of the services in the "iombian-services" folder, but not the composes.
         """
         logger.info("IoMBian Installed Services Handler stopped.")
-        self.observer.stop()
-        for service in self.services:
+        for service in self.services.values():
             service.stop()
+        self.observer.stop()
+        if self.docker_api:
+            self.docker_api.close()
 
     def read_local_services(self):
-        """Read the services in "iombian-services", start them and add them to the `services` list."""
-        self.services = []
+        """Read the services in "iombian-services", start them and add them to the `services` dict."""
+        self.services = {}
         service_names = os.listdir(self.base_path)
         for service_name in service_names:
-            service_path = f"{self.base_path}/{service_name}"
-            service = InstalledServiceHandler(service_path, self.wait_seconds)
-            service.start()
-            self.services.append(service)
+            service = self._read_local_service(service_name)
+            self.services[service.service_name] = service
 
     def on_created(self, event: FileSystemEvent):
         """When a new service is added to "iombian-services", start the service and the compose of the services.
 
         A service is added when a folder is created in the "iombian-services" folder.
+        The compose is started by the reload thread of the service, so the shared observer is not blocked.
         """
         if not isinstance(event, DirCreatedEvent):
             return
 
         service_path = event.src_path
-        service_name = pathlib.Path(service_path).stem
-        logger.debug(f"{service_name} service folder was created.")
-        service = InstalledServiceHandler(service_path, self.wait_seconds)
-        service.up()
-        service.start()
-        self.services.append(service)
-        logger.debug(f"{service_path} service added.")
+        service_name = os.path.basename(service_path)
+        logger.debug("%s service folder was created.", service_name)
+        service = InstalledServiceHandler(
+            service_path,
+            self.wait_seconds,
+            self.get_docker_api,
+            self.observer,
+        )
+        service.start(up=True)
+        self.services[service.service_name] = service
+        logger.debug("%s service added.", service_path)
 
     def on_deleted(self, event: FileSystemEvent):
         """When a service is removed from "iombian-services", stop the service and the compose of the services.
 
         A service is removed when a folder is deleted from the "iombian-services" folder.
+        The compose is stopped in a new thread, so the shared observer is not blocked.
         """
         if not isinstance(event, DirDeletedEvent):
             return
 
-        service_name = pathlib.Path(event.src_path).stem
-        logger.debug(f"{service_name} service folder was removed.")
+        service_name = os.path.basename(event.src_path)
+        logger.debug("%s service folder was removed.", service_name)
         service = self._get_service_by_name(service_name)
         if service:
             service.stop()
+            Thread(target=self._down_service, args=(service,)).start()
+            del self.services[service_name]
+            logger.debug("%s service removed.", service_name)
+
+    def get_docker_api(self):
+        """Get the docker engine API client, creating it the first time it is needed.
+
+        The client is not created on `__init__` because it contacts the docker daemon to detect the API version,
+        and the daemon may not be running yet when the handler starts.
+        """
+        with self.docker_api_lock:
+            if self.docker_api is None:
+                self.docker_api = DockerApiClient.from_env()
+            return self.docker_api
+
+    def _down_service(self, service: InstalledServiceHandler):
+        """Stop the compose of a removed service, logging any error.
+
+        The reload thread of the service is waited first, so any compose up in progress finishes before the teardown.
+        """
+        try:
+            if service.reload_thread.is_alive():
+                service.reload_thread.join()
             service.down()
-            self.services.remove(service)
-            logger.debug(f"{service_name} service removed.")
+        except Exception:
+            logger.exception(
+                "An error occurred, couldn't stop service %s.", service.service_name
+            )
+
+    def _read_local_service(self, service_name: str):
+        """Create the handler of a service in "iombian-services" and start it."""
+        service_path = f"{self.base_path}/{service_name}"
+        service = InstalledServiceHandler(
+            service_path,
+            self.wait_seconds,
+            self.get_docker_api,
+            self.observer,
+        )
+        service.start()
+        return service
 
     def _get_service_by_name(self, service_name: str):
         """Given the service name, return the service in "iombian-services"."""
-        for service in self.services:
-            if service.service_name == service_name:
-                return service
+        return self.services.get(service_name)
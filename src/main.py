@@ -1,32 +1,91 @@
 import logging
 import os
 import signal
+import threading
+import time
+from dataclasses import dataclass
+from functools import cache
 
 import sdnotify
 
 from iombian_services_handler import IombianServicesHandler
 
-BASE_PATH = os.environ.get("BASE_PATH", "/opt/iombian-services")
-WAIT_SECONDS = int(os.environ.get("WAIT_SECONDS", 1))
-LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+STOP_SIGNALS = {signal.SIGINT, signal.SIGTERM}
+LOG_FORMAT = "%(asctime)s %(levelname)-8s - %(name)-16s - %(message)s"
 
-logging.basicConfig(
-    format="%(asctime)s %(levelname)-8s - %(name)-16s - %(message)s", level=LOG_LEVEL
-)
 logger = logging.getLogger(__name__)
 
 
-def signal_handler(sig, frame):
-    iombian_services_handler.stop()
+@dataclass(frozen=True)
+class Config:
+    """Configuration of the handler, read from the environment variables."""
 
+    base_path: str
+    """The path where the installed services are stored"""
+    wait_seconds: int
+    """Seconds waited between changes on a service before restarting it"""
+    log_level: str
+    """The log level of the python logger"""
 
-if __name__ == "__main__":
-    iombian_services_handler = IombianServicesHandler(BASE_PATH, WAIT_SECONDS)
+
+class CachedTimeFormatter(logging.Formatter):
+    """Log formatter that formats the date and time of the records only once per second.
+
+    Only the milliseconds are formatted on every record, the rest is taken from the cache.
+    """
+
+    def __init__(self, fmt: str):
+        super().__init__(fmt)
+        self._cached_time = (None, "")
+
+    def formatTime(self, record: logging.LogRecord, datefmt=None):
+        second = int(record.created)
+        cached_second, prefix = self._cached_time
+        if second != cached_second:
+            prefix = time.strftime(self.default_time_format, self.converter(second))
+            self._cached_time = (second, prefix)
+        return self.default_msec_format % (prefix, record.msecs)
+
+
+@cache
+def load_config():
+    """Read the configuration from the environment variables only once."""
+    return Config(
+        base_path=os.environ.get("BASE_PATH", "/opt/iombian-services"),
+        wait_seconds=int(os.environ.get("WAIT_SECONDS", 1)),
+        log_level=os.environ.get("LOG_LEVEL", "INFO"),
+    )
+
+
+def main():
+    """Start the handler with the configuration of the environment and run it until a stop signal arrives."""
+    config = load_config()
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    log_handler = logging.StreamHandler()
+    log_handler.setFormatter(CachedTimeFormatter(LOG_FORMAT))
+    logging.basicConfig(level=config.log_level, handlers=[log_handler])
+
+    stop_event = threading.Event()
+
+    def signal_handler(sig, frame):
+        stop_event.set()
+
+    for stop_signal in STOP_SIGNALS:
+        signal.signal(stop_signal, signal_handler)
+
+    iombian_services_handler = IombianServicesHandler(
+        config.base_path, config.wait_seconds
+    )
     iombian_services_handler.read_local_services()
     iombian_services_handler.start()
     notifier = sdnotify.SystemdNotifier()
     notifier.notify("READY=1")
 
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    signal.pause()
+    stop_event.wait()
+    iombian_services_handler.stop()
+
+
+if __name__ == "__main__":
+    main()